@@ -6,17 +6,24 @@
 # See: https://opensource.org/licenses/MIT
 
 import os
-import hashlib
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, ttk
 import threading
 import queue
 from collections import defaultdict
 
+from checksums import METADATA_NAMES, HashManifest
+from fileops import hash_file, replace_with_hardlink
+from reports import (DUPLICATE_FIELDS, REPORT_FILETYPES, ReportWriter, read_duplicate_sets,
+                     write_duplicate_set)
+from scan import normalize_roots, scan_files
+from throttle import Throttle, parse_limit, set_idle_priority
+
 
 class DuplicateFinderGUI:
     """A GUI to find and safely remove duplicate music files."""
     APP_VERSION = "1.0.0"
+    HASH_WORKERS = 2
 
     def __init__(self, root):
         self.root = root
@@ -25,11 +32,23 @@ class DuplicateFinderGUI:
         self.root.minsize(700, 500)
         self.root.configure(bg="#2e2e2e")
 
-        self.source_dir = tk.StringVar()
+        self.source_dir = tk.StringVar()  # Display text for source_dirs
+        self.source_dirs = []
         self.status_text = tk.StringVar(value="Ready.")
         self.progress_var = tk.DoubleVar(value=0)
         self.is_running = False
         self.duplicate_sets = []
+        self.file_info = {}  # path -> ((st_dev, st_ino), size, st_nlink, st_mtime_ns)
+        self.report_path = tk.StringVar()  # Duplicate sets are streamed here while scanning, if set
+        self.report_loaded = False
+
+        # --- Throttling (adjustable while a scan is in progress) ---
+        self.max_mb_per_sec = tk.StringVar(value="0")
+        self.max_files_per_sec = tk.StringVar(value="0")
+        self.idle_priority = tk.BooleanVar(value=False)
+        self.throttle = Throttle()
+        self.max_mb_per_sec.trace_add("write", self.update_throttle)
+        self.max_files_per_sec.trace_add("write", self.update_throttle)
 
         self.create_widgets()
 
@@ -44,16 +63,30 @@ class DuplicateFinderGUI:
         top_frame.grid(row=0, column=0, sticky="ew", pady=(0, 10))
         top_frame.columnconfigure(1, weight=1)
 
-        tk.Label(top_frame, text="Music Library Folder:", fg="white", bg="#2e2e2e").grid(row=0, column=0, sticky="w",
+        tk.Label(top_frame, text="Music Library Folders:", fg="white", bg="#2e2e2e").grid(row=0, column=0, sticky="w",
                                                                                          padx=(0, 10))
         tk.Entry(top_frame, textvariable=self.source_dir, state="readonly", readonlybackground="#555", fg="white").grid(
             row=0, column=1, sticky="ew")
-        tk.Button(top_frame, text="Browse...", command=self.select_source_dir).grid(row=0, column=2, padx=(10, 0))
+        tk.Button(top_frame, text="Add...", command=self.select_source_dir).grid(row=0, column=2, padx=(10, 0))
+        tk.Button(top_frame, text="Clear", command=self.clear_source_dirs).grid(row=0, column=3, padx=(5, 0))
 
         self.find_button = tk.Button(top_frame, text="🔍 Find Duplicates", command=self.start_finding_thread,
                                      bg="#4a4a4a", fg="white", font=("Helvetica", 10, "bold"), relief=tk.FLAT, padx=10,
                                      pady=5)
-        self.find_button.grid(row=0, column=3, padx=(20, 0))
+        self.find_button.grid(row=0, column=4, padx=(20, 0))
+
+        tk.Label(top_frame, text="Save Report To:", fg="white", bg="#2e2e2e").grid(row=1, column=0, sticky="w",
+                                                                                   padx=(0, 10), pady=(5, 0))
+        tk.Entry(top_frame, textvariable=self.report_path, state="readonly", readonlybackground="#555",
+                 fg="white").grid(row=1, column=1, sticky="ew", pady=(5, 0))
+        tk.Button(top_frame, text="Browse...", command=self.select_report_path).grid(row=1, column=2, padx=(10, 0),
+                                                                                     pady=(5, 0))
+        tk.Button(top_frame, text="Clear", command=lambda: self.report_path.set("")).grid(row=1, column=3,
+                                                                                          padx=(5, 0), pady=(5, 0))
+        self.load_button = tk.Button(top_frame, text="📂 Load Report", command=self.start_loading_thread,
+                                     bg="#4a4a4a", fg="white", font=("Helvetica", 10, "bold"), relief=tk.FLAT, padx=10,
+                                     pady=5)
+        self.load_button.grid(row=1, column=4, sticky="ew", padx=(20, 0), pady=(5, 0))
 
         # --- Progress Bar ---
         self.progress_bar = ttk.Progressbar(main_frame, variable=self.progress_var, maximum=100)
@@ -88,117 +121,319 @@ class DuplicateFinderGUI:
                                        relief=tk.FLAT, padx=10, pady=5)
         self.delete_button.pack(side=tk.RIGHT)
 
+        self.hardlink_button = tk.Button(bottom_frame, text="🔗 Hardlink Instead", command=self.hardlink_selected,
+                                         state="disabled", bg="#2c6e91", fg="white", font=("Helvetica", 10, "bold"),
+                                         relief=tk.FLAT, padx=10, pady=5)
+        self.hardlink_button.pack(side=tk.RIGHT, padx=(0, 10))
+
+        tk.Label(bottom_frame, text="Max MB/s:", fg="white", bg="#2e2e2e").pack(side=tk.LEFT)
+        tk.Entry(bottom_frame, textvariable=self.max_mb_per_sec, width=6, bg="#555", fg="white").pack(
+            side=tk.LEFT, padx=(5, 15))
+        tk.Label(bottom_frame, text="Max files/s:", fg="white", bg="#2e2e2e").pack(side=tk.LEFT)
+        tk.Entry(bottom_frame, textvariable=self.max_files_per_sec, width=6, bg="#555", fg="white").pack(
+            side=tk.LEFT, padx=(5, 15))
+        tk.Checkbutton(bottom_frame, text="Idle priority", variable=self.idle_priority, fg="white", bg="#2e2e2e",
+                       selectcolor="#1e1e1e", activebackground="#2e2e2e", activeforeground="white").pack(side=tk.LEFT)
+
         tk.Label(self.root, textvariable=self.status_text, bd=1, relief=tk.SUNKEN, anchor=tk.W, bg="#3a3a3a",
                  fg="white").pack(side=tk.BOTTOM, fill=tk.X)
 
     def select_source_dir(self):
-        path = filedialog.askdirectory(title="Select your music library folder to scan")
-        if path: self.source_dir.set(path)
+        path = filedialog.askdirectory(title="Add a music library folder to scan")
+        if path and path not in self.source_dirs:
+            self.source_dirs.append(path)
+            self.source_dir.set("; ".join(self.source_dirs))
+
+    def clear_source_dirs(self):
+        self.source_dirs = []
+        self.source_dir.set("")
+
+    def select_report_path(self):
+        path = filedialog.asksaveasfilename(title="Save duplicate report as", defaultextension=".jsonl",
+                                            filetypes=REPORT_FILETYPES)
+        if path: self.report_path.set(path)
+
+    def update_throttle(self, *_):
+        self.throttle.set_limits(parse_limit(self.max_mb_per_sec.get()), parse_limit(self.max_files_per_sec.get()))
 
     def start_finding_thread(self):
         if self.is_running: return
 
-        source = self.source_dir.get()
-        if not source:
+        sources = list(self.source_dirs)
+        if not sources:
             messagebox.showerror("Error", "Please select a source folder to scan.")
             return
+        report = None
+        if self.report_path.get():
+            # Opened here so a bad location is reported before the scan starts
+            try:
+                report = ReportWriter(self.report_path.get(), DUPLICATE_FIELDS)
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not write to '{self.report_path.get()}':\n{e}")
+                return
+
+        self.begin_run("Scanning files by size...")
+        self.report_loaded = False
+        self.update_throttle()
+        thread = threading.Thread(target=self.find_duplicates_worker,
+                                  args=(sources, self.idle_priority.get(), report), daemon=True)
+        thread.start()
+
+    def start_loading_thread(self):
+        if self.is_running: return
+
+        path = filedialog.askopenfilename(title="Load a saved duplicate report", filetypes=REPORT_FILETYPES)
+        if not path: return
+
+        self.begin_run("Loading report...")
+        self.report_loaded = True
+        thread = threading.Thread(target=self.load_report_worker, args=(path,), daemon=True)
+        thread.start()
 
+    def begin_run(self, status):
         self.is_running = True
         self.tree.delete(*self.tree.get_children())
         self.find_button.config(state="disabled")
+        self.load_button.config(state="disabled")
         self.delete_button.config(state="disabled")
-        self.status_text.set("Scanning files by size...")
+        self.hardlink_button.config(state="disabled")
+        self.status_text.set(status)
         self.progress_var.set(0)
 
-        thread = threading.Thread(target=self.find_duplicates_worker, args=(source,), daemon=True)
-        thread.start()
+    def find_duplicates_worker(self, folders, idle_priority=False, report=None):
+        if idle_priority and not set_idle_priority():
+            self.root.after(0, lambda: messagebox.showwarning(
+                "Idle priority", "Idle priority isn't available on this system; scanning at normal priority."))
+        self.status_text.set("Scanning and hashing...")
+        manifests = {root: HashManifest(root) for root in normalize_roots(folders)}  # Reuse verified-copy hashes
 
-    def find_duplicates_worker(self, folder):
+        # Scanning and hashing run as a pipeline: a file is queued for hashing as soon as
+        # another file of the same size turns up, while the folders are still being walked.
         files_by_size = defaultdict(list)
-        # Phase 1: Scan by file size (fast pre-filter)
-        all_files = [os.path.join(r, f) for r, d, fs in os.walk(folder) for f in fs]
-        total_files = len(all_files)
-
-        for i, path in enumerate(all_files):
-            try:
-                size = os.path.getsize(path)
-                files_by_size[size].append(path)
-            except OSError:
-                continue  # Skip inaccessible files
-            self.progress_var.set((i + 1) / total_files * 50)
-
-        # Phase 2: Hash potential duplicates
-        self.status_text.set("Finding duplicates by content (hashing)...")
-        hashes = defaultdict(list)
-        potential_dupes = {size: files for size, files in files_by_size.items() if len(files) > 1}
-
-        files_to_hash_count = sum(len(files) for files in potential_dupes.values())
-        hashed_count = 0
-
-        for size, files in potential_dupes.items():
-            for path in files:
+        hashes = defaultdict(lambda: defaultdict(list))  # size -> md5 -> inodes
+        hash_queue = queue.Queue()
+        lock = threading.Lock()
+        counts = {'queued': 0, 'hashed': 0}
+
+        # Hardlinked paths share one inode: group them so each inode is hashed only once
+        inode_paths = defaultdict(list)
+        inode_roots = {}
+        self.file_info = {}
+
+        # Report rows are written as soon as a (size, md5) gets its second inode, so a set's
+        # rows may be interleaved with others; later members are appended under the same id
+        set_ids = {}  # (size, md5) -> set number
+        reported = {}  # inode -> (set number, md5, size), for hardlinks found after it was written
+
+        def report_files(paths):
+            return [(path, self.file_info[path][3], self.file_info[path][0][1]) for path in paths]
+
+        def report_inode(key, inode):
+            set_number = set_ids[key]
+            reported[inode] = (set_number, key[1], key[0])
+            write_duplicate_set(report, set_number, key[1], key[0], report_files(inode_paths[inode]))
+
+        def hash_worker():
+            if idle_priority:
+                set_idle_priority()  # Windows background mode is per-thread and not inherited
+            while True:
+                job = hash_queue.get()
+                if job is None:
+                    return
+                size, inode, path, root = job
                 try:
-                    hash_md5 = self.hash_file(path)
-                    hashes[hash_md5].append(path)
+                    hash_md5 = manifests[root].lookup(path) or hash_file(path, self.throttle)
                 except (IOError, OSError):
-                    continue
-                hashed_count += 1
-                self.progress_var.set(50 + (hashed_count / files_to_hash_count * 50))
+                    hash_md5 = None
+                with lock:
+                    if hash_md5:
+                        dupes = hashes[size][hash_md5]
+                        dupes.append(inode)
+                        if report and len(dupes) >= 2:
+                            key = (size, hash_md5)
+                            if key not in set_ids:
+                                set_ids[key] = len(set_ids) + 1
+                                report_inode(key, dupes[0])
+                            report_inode(key, inode)
+                    counts['hashed'] += 1
+                    self.progress_var.set(counts['hashed'] / counts['queued'] * 100)
+
+        def queue_hash(size, inode):
+            with lock:
+                counts['queued'] += 1
+            hash_queue.put((size, inode, inode_paths[inode][0], inode_roots[inode]))
+
+        hashers = [threading.Thread(target=hash_worker, daemon=True) for _ in range(self.HASH_WORKERS)]
+        for thread in hashers:
+            thread.start()
+
+        for i, (root, path, st) in enumerate(scan_files(folders, with_stat=True, idle_priority=idle_priority)):
+            if os.path.basename(path) in METADATA_NAMES:
+                continue
+            inode = (st.st_dev, st.st_ino)
+            self.file_info[path] = (inode, st.st_size, st.st_nlink, st.st_mtime_ns)
+            if inode in inode_paths:
+                with lock:
+                    inode_paths[inode].append(path)
+                    if inode in reported:
+                        set_number, hash_md5, size = reported[inode]
+                        write_duplicate_set(report, set_number, hash_md5, size, report_files([path]))
+                continue
+            inode_paths[inode].append(path)
+            inode_roots[inode] = root
+
+            bucket = files_by_size[st.st_size]
+            bucket.append(inode)
+            if len(bucket) == 2:
+                queue_hash(st.st_size, bucket[0])  # The first file only becomes a candidate now
+            if len(bucket) >= 2:
+                queue_hash(st.st_size, inode)
+            if i % 500 == 0:
+                self.status_text.set(f"Scanning and hashing... ({i} files scanned, {counts['hashed']} hashed)")
+
+        self.status_text.set("Finishing hashing...")
+        for _ in hashers:
+            hash_queue.put(None)
+        for thread in hashers:
+            thread.join()
+
+        # The report is already written; the sets shown are only complete once the scan is
+        self.duplicate_sets = []
+        for size, by_hash in hashes.items():
+            # Only distinct inodes count as duplicates; links to the same inode are listed with it
+            for hash_md5, dupes in by_hash.items():
+                if len(dupes) > 1:
+                    file_list = sorted(path for inode in dupes for path in inode_paths[inode])
+                    self.duplicate_sets.append(file_list)
 
-        self.duplicate_sets = [files for files in hashes.values() if len(files) > 1]
+        if report:
+            report.close()
 
         # Signal completion to the main thread
         self.root.after(0, self.on_find_complete)
 
+    def load_report_worker(self, report_path, sets=None):
+        """Rebuilds the results from a saved report (or the sets already shown) by checking
+        each file is still there and unchanged in size, modification time and inode, like
+        HashManifest.lookup does. Nothing is hashed again."""
+        self.file_info = {}
+        self.duplicate_sets = []
+        try:
+            sets = list(read_duplicate_sets(report_path)) if sets is None else sets
+        except (OSError, ValueError, KeyError) as e:
+            self.status_text.set(f"Could not read report: {e}")
+            sets = []
+
+        for i, (size, files) in enumerate(sets):
+            file_list = []
+            for path, mtime_ns, ino in files:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue  # Deleted since the report was written
+                if (st.st_size != size or mtime_ns not in (None, st.st_mtime_ns)
+                        or ino not in (None, st.st_ino)):
+                    continue  # Changed since it was hashed, so it can't be trusted as a duplicate
+                self.file_info[path] = ((st.st_dev, st.st_ino), st.st_size, st.st_nlink, st.st_mtime_ns)
+                file_list.append(path)
+            if len({self.file_info[path][0] for path in file_list}) > 1:
+                self.duplicate_sets.append(sorted(file_list))
+            self.progress_var.set((i + 1) / len(sets) * 100)
+
+        self.root.after(0, self.on_find_complete)
+
+    def refresh_results(self):
+        """Shows the state after files were removed: a loaded report is re-checked without
+        hashing, a fresh scan is simply run again."""
+        if not self.report_loaded:
+            self.start_finding_thread()
+            return
+        # Inodes aren't compared here, since replacing a file with a hardlink changes its inode
+        sets = [(self.file_info[paths[0]][1], [(path, self.file_info[path][3], None) for path in paths])
+                for paths in self.duplicate_sets]
+        self.begin_run("Refreshing report...")
+        thread = threading.Thread(target=self.load_report_worker, args=("", sets), daemon=True)
+        thread.start()
+
     def on_find_complete(self):
         self.is_running = False
         self.find_button.config(state="normal")
+        self.load_button.config(state="normal")
         self.progress_var.set(100)
 
         if not self.duplicate_sets:
             self.status_text.set("Scan complete. No duplicate files found!")
-            messagebox.showinfo("Finished", "No duplicate files were found in the selected folder.")
+            messagebox.showinfo("Finished", "No duplicate files were found in the selected folders.")
             return
 
         # Populate the treeview
         self.tree.tag_configure('keep', background='#2c3e50', foreground='white')
+        self.tree.tag_configure('link', background='#2c3e3a', foreground='#ddffdd')
         self.tree.tag_configure('delete', background='#3e2c2c', foreground='#ffdddd')
 
+        to_remove = []
         for i, file_list in enumerate(self.duplicate_sets):
-            # Keep the first file, mark others for deletion
+            # Keep the first file (and any hardlinks to it), mark others for deletion
             file_list.sort()  # Sort to have a predictable "keep" file
+            keep_inode = self.file_info[file_list[0]][0]
             parent_id = self.tree.insert("", "end", text=f"Set {i + 1}",
                                          values=(f"Duplicate Set {i + 1} ({len(file_list)} files)", ""), open=True)
 
             for j, file_path in enumerate(file_list):
-                file_size = f"{os.path.getsize(file_path) / 1024 / 1024:.2f} MB"
-                tags = ('keep',) if j == 0 else ('delete',)
+                inode, size, _, _ = self.file_info[file_path]
+                file_size = f"{size / 1024 / 1024:.2f} MB"
+                if j == 0:
+                    tags = ('keep',)
+                elif inode == keep_inode:
+                    tags = ('link',)
+                else:
+                    tags = ('delete',)
+                    to_remove.append(file_path)
                 self.tree.insert(parent_id, "end", values=(file_path, file_size), tags=tags)
 
-        total_dupes = sum(len(s) - 1 for s in self.duplicate_sets)
-        self.status_text.set(f"Scan complete. Found {total_dupes} duplicate files in {len(self.duplicate_sets)} sets.")
+        reclaimable = self.reclaimable_size(to_remove)
+        self.status_text.set(f"Scan complete. Found {len(to_remove)} duplicate files in {len(self.duplicate_sets)} "
+                             f"sets ({reclaimable / 1024 / 1024:.2f} MB reclaimable).")
         self.delete_button.config(state="normal")
-
-    def delete_selected(self):
-        to_delete = []
+        self.hardlink_button.config(state="normal")
+
+    def reclaimable_size(self, paths):
+        """Space actually freed by removing `paths`: an inode only counts once every one of
+        its links is removed, so hardlinks that stay behind (even outside the scanned
+        folder) keep their data alive."""
+        sizes, links, removed = {}, {}, defaultdict(int)
+        for path in paths:
+            inode, size, nlink, _ = self.file_info[path]
+            sizes[inode], links[inode] = size, nlink
+            removed[inode] += 1
+        return sum(sizes[inode] for inode, count in removed.items() if count >= links[inode])
+
+    def marked_duplicates(self):
+        """Returns (path, link_target) pairs for every file marked for removal.
+
+        Hardlinks can't cross devices, so the target is the first file of the set on the
+        same device as `path`: the kept file where it can be, otherwise the first copy
+        on that device. It's None for that first copy, which has nothing to link to.
+        """
+        marked = []
         for parent in self.tree.get_children():
-            children = self.tree.get_children(parent)
-            # The first child is kept, the rest are potential deletions
-            to_delete.extend(children[1:])
+            first_on_device = {}
+            for item_id in self.tree.get_children(parent):
+                path = self.tree.set(item_id, "path")
+                device = self.file_info[path][0][0]
+                target = first_on_device.setdefault(device, path)
+                if 'delete' in self.tree.item(item_id, "tags"):
+                    marked.append((path, target if target != path else None))
+        return marked
 
-        if not to_delete:
+    def delete_selected(self):
+        marked = self.marked_duplicates()
+        if not marked:
             messagebox.showinfo("No files", "No files are marked for deletion.")
             return
 
-        total_size = 0
-        paths_to_delete = []
-        for item_id in to_delete:
-            path = self.tree.set(item_id, "path")
-            paths_to_delete.append(path)
-            try:
-                total_size += os.path.getsize(path)
-            except OSError:
-                continue
+        paths_to_delete = [path for path, _ in marked]
+        total_size = self.reclaimable_size(paths_to_delete)
 
         msg = f"Are you sure you want to permanently delete {len(paths_to_delete)} files?\n\n"
         msg += f"This will free up approximately {total_size / 1024 / 1024:.2f} MB of space.\n\n"
@@ -214,19 +449,42 @@ class DuplicateFinderGUI:
                     self.status_text.set(f"Error deleting {os.path.basename(path)}: {e}")
 
             messagebox.showinfo("Deletion Complete", f"Successfully deleted {deleted_count} files.")
-            # Rescan to show updated state
-            self.start_finding_thread()
+            # Refresh to show updated state
+            self.refresh_results()
+
+    def hardlink_selected(self):
+        marked = self.marked_duplicates()
+        if not marked:
+            messagebox.showinfo("No files", "No files are marked for replacement.")
+            return
+
+        linkable = [(path, target) for path, target in marked if target]
+        skipped = len(marked) - len(linkable)
+        if not linkable:
+            messagebox.showinfo("No files", "None of the marked files share a device with another copy, "
+                                            "so none can be hardlinked.")
+            return
+        total_size = self.reclaimable_size([path for path, _ in linkable])
+
+        msg = f"Replace {len(linkable)} duplicate files with hardlinks to the kept copy?\n\n"
+        msg += f"This will free up approximately {total_size / 1024 / 1024:.2f} MB of space.\n\n"
+        if skipped:
+            msg += (f"{skipped} marked files are on a different device from the kept copy and stay as that "
+                    "device's copy, since hardlinks can't cross devices. Other duplicates there are linked to them.\n\n")
+        msg += "Every path keeps working, but they will all share one copy of the data."
+
+        if messagebox.askyesno("Confirm Hardlinking", msg):
+            linked_count = 0
+            for path, target in linkable:
+                try:
+                    replace_with_hardlink(target, path)
+                    linked_count += 1
+                except OSError as e:
+                    self.status_text.set(f"Error linking {os.path.basename(path)}: {e}")
 
-    @staticmethod
-    def hash_file(path):
-        """Calculates the MD5 hash of a file."""
-        hasher = hashlib.md5()
-        with open(path, 'rb') as f:
-            buf = f.read(65536)  # Read in 64kb chunks
-            while len(buf) > 0:
-                hasher.update(buf)
-                buf = f.read(65536)
-        return hasher.hexdigest()
+            messagebox.showinfo("Hardlinking Complete", f"Successfully replaced {linked_count} files with hardlinks.")
+            # Refresh to show updated state
+            self.refresh_results()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+# RhythmShelf Checksums
+# Version: 1.0.0
+# Author: Lewis
+#
+# This work is licensed under the MIT License.
+# See: https://opensource.org/licenses/MIT
+
+import json
+import os
+import threading
+from collections import defaultdict
+
+from fileops import files_equal, partial_hash
+from scan import scan_files
+
+MANIFEST_NAME = ".rhythmshelf-hashes.jsonl"
+INDEX_NAME = ".rhythmshelf-index.jsonl"
+METADATA_NAMES = (MANIFEST_NAME, INDEX_NAME)
+
+
+class HashManifest:
+    """An append-only record of MD5 hashes for files under a library folder.
+
+    The organiser writes an entry for every verified copy; the duplicate finder reuses
+    those hashes instead of reading the files again. An entry is only trusted while the
+    file's size and modification time still match what was recorded. `name` lets other
+    kinds of hash (like LibraryIndex's partial hashes) be kept in a file of their own. A
+    `read_only` manifest keeps new entries in memory and never writes to the library.
+    """
+
+    def __init__(self, library_folder, name=MANIFEST_NAME, read_only=False):
+        self.library_folder = library_folder
+        self.path = os.path.join(library_folder, name)
+        self.read_only = read_only
+        self.entries = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self.entries[entry['path']] = (entry['size'], entry['mtime_ns'], entry['md5'])
+                except (ValueError, KeyError, TypeError):
+                    continue  # Skip a partially written or hand-edited line
+
+    def _key(self, path):
+        return os.path.relpath(path, self.library_folder).replace(os.sep, '/')
+
+    def lookup(self, path, stat=None):
+        """Returns the recorded hash for `path`, or None if it's missing or out of date."""
+        entry = self.entries.get(self._key(path))
+        if entry is None:
+            return None
+        try:
+            stat = stat or os.stat(path)
+        except OSError:
+            return None
+        size, mtime_ns, digest = entry
+        if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+            return None
+        return digest
+
+    def add(self, path, digest, stat=None):
+        """Records the hash of a file that now exists at `path`."""
+        stat = stat or os.stat(path)
+        key = self._key(path)
+        entry = {'path': key, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'md5': digest}
+        with self._lock:
+            self.entries[key] = (stat.st_size, stat.st_mtime_ns, digest)
+            if self.read_only:
+                return
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+
+
+class LibraryIndex:
+    """A size plus partial-hash index of a library, used to spot incoming files whose
+    content is already there.
+
+    Sizes come from one walk of the library. Partial hashes are only computed for library
+    files whose size matches an incoming file, and are kept in the library so later
+    imports don't compute them again. A partial match is confirmed byte for byte before
+    it's reported, so a file is never skipped on a hash collision. A `read_only` index, as
+    used for dry runs, doesn't save the partial hashes it computes.
+    """
+
+    def __init__(self, library_folder, throttle=None, idle_priority=False, read_only=False):
+        self.throttle = throttle
+        self.partial_hashes = HashManifest(library_folder, INDEX_NAME, read_only)
+        self.by_size = defaultdict(list)
+        for _, path, st in scan_files([library_folder], with_stat=True, idle_priority=idle_priority):
+            if os.path.basename(path) not in METADATA_NAMES:
+                self.by_size[st.st_size].append(path)
+
+    def _partial_hash(self, path):
+        digest = self.partial_hashes.lookup(path)
+        if digest is None:
+            digest = partial_hash(path, self.throttle)
+            self.partial_hashes.add(path, digest)
+        return digest
+
+    def find(self, source_path, size):
+        """Returns the path of a library file with the same content as `source_path`, or None."""
+        candidates = self.by_size.get(size)
+        if not candidates:
+            return None
+        source_hash = partial_hash(source_path, self.throttle)
+        for path in candidates:
+            try:
+                if self._partial_hash(path) == source_hash and files_equal(source_path, path, self.throttle):
+                    return path
+            except OSError:
+                continue  # Removed from the library since it was indexed
+        return None
+
+    def add(self, path, size):
+        """Records a file that has just been added to the library."""
+        self.by_size[size].append(path)
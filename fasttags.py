@@ -0,0 +1,265 @@
+# RhythmShelf Fast Tag Reader
+# Version: 1.0.0
+# Author: Lewis
+#
+# This work is licensed under the MIT License.
+# See: https://opensource.org/licenses/MIT
+
+import os
+import struct
+
+from sniff import HEADER_SIZE, is_non_audio, open_audio, sniff_header
+
+# Never read more than this many bytes of tag data from a single file
+MAX_TAG_BYTES = 256 * 1024
+
+ID3_FRAMES = {b'TPE1': 'artist', b'TALB': 'album', b'TP1': 'artist', b'TAL': 'album'}
+VORBIS_KEYS = {'ARTIST': 'artist', 'ALBUM': 'album'}
+MP4_ATOMS = {b'\xa9ART': 'artist', b'\xa9alb': 'album'}
+
+# A file only counts as tagged if mutagen's easy interface would show a key for it, so
+# these are the frames and atoms it maps (ID3v2.2 ids are upgraded to v2.3/2.4 ones first)
+EASY_ID3_FRAMES = {
+    b'TALB', b'TBPM', b'TCMP', b'TCOM', b'TCON', b'TCOP', b'TDOR', b'TDRC', b'TENC', b'TEXT', b'TIT2',
+    b'TIT3', b'TLAN', b'TLEN', b'TMED', b'TMOO', b'TOLY', b'TORY', b'TPE1', b'TPE2', b'TPE3', b'TPE4',
+    b'TPOS', b'TPUB', b'TRCK', b'TSO2', b'TSOA', b'TSOC', b'TSOP', b'TSOT', b'TSRC', b'TSST', b'TYER',
+    b'WOAR', b'TAL', b'TBP', b'TCM', b'TCO', b'TCR', b'TEN', b'TLA', b'TLE', b'TMT', b'TOL', b'TOR',
+    b'TP1', b'TP2', b'TP3', b'TP4', b'TPA', b'TPB', b'TRC', b'TRK', b'TT2', b'TT3', b'TXT', b'TYE', b'WAR',
+}
+EASY_MP4_ATOMS = {
+    b'\xa9nam', b'\xa9alb', b'\xa9ART', b'aART', b'\xa9wrt', b'\xa9day', b'\xa9cmt', b'desc', b'purd',
+    b'\xa9grp', b'\xa9gen', b'cprt', b'soaa', b'soar', b'sonm', b'soal', b'soco', b'tmpo', b'trkn', b'disk',
+}
+# Whether these are mapped depends on their description, which only mutagen checks
+EASY_ID3_KEYED = {b'TXXX', b'UFID', b'RVA2', b'TMCL', b'TXX', b'UFI', b'RVA'}
+EASY_MP4_KEYED = {b'----'}
+ID3_ENCODINGS = ('latin-1', 'utf-16', 'utf-16-be', 'utf-8')
+
+
+class Ambiguous(Exception):
+    """Raised when the fast path can't be sure it would agree with mutagen."""
+
+
+def read_sort_tags(path):
+    """Reads just the artist and album needed to sort a file into the library.
+
+    Returns an (artist, album) tuple, where a missing field is None, or None if the file
+    isn't audio at all. Raises ValueError if the file has no tags. Formats the fast path
+    doesn't handle, and anything it can't parse with certainty, go through mutagen.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+        kind = sniff_header(header, f, path)
+        if kind is None and is_non_audio(path, header):
+            return None
+        try:
+            fields = _read_fields(f, kind, header)
+        except (Ambiguous, struct.error, UnicodeDecodeError, IndexError, OSError):
+            fields = None
+
+    if fields is None:
+        audio = open_audio(path, easy=True)
+        if not audio: raise ValueError("Not a supported audio file.")
+        fields = {key: audio[key][0] for key in ('artist', 'album') if audio.get(key)}
+    elif not fields.pop('_tagged'):
+        raise ValueError("No tags found.")
+    return fields.get('artist'), fields.get('album')
+
+
+def _read_fields(f, kind, header):
+    if kind == 'mp3':
+        return _read_id3(f, header)
+    if kind == 'flac':
+        return _read_flac(f, header)
+    if kind in ('vorbis', 'opus'):
+        return _read_ogg(f, kind)
+    if kind == 'mp4':
+        return _read_mp4(f)
+    return None
+
+
+def _first(fields, key, value):
+    if key not in fields and value:
+        fields[key] = value
+
+
+def _id3_size(data):
+    return (data[0] & 0x7f) << 21 | (data[1] & 0x7f) << 14 | (data[2] & 0x7f) << 7 | (data[3] & 0x7f)
+
+
+def _decode_id3_text(data):
+    encoding = data[0]
+    if encoding >= len(ID3_ENCODINGS):
+        raise Ambiguous()
+    text = data[1:].decode(ID3_ENCODINGS[encoding])
+    return text.split('\x00')[0]
+
+
+def _read_id3(f, header):
+    fields = {'_tagged': False}
+    keyed = False  # Saw a frame the easy interface may or may not map
+    if header.startswith(b'ID3'):
+        version, flags = header[3], header[5]
+        if version not in (2, 3, 4) or flags & 0xc0:
+            raise Ambiguous()  # Unsynchronised tags and extended headers are left to mutagen
+        tag_size = _id3_size(header[6:10])
+        if tag_size > MAX_TAG_BYTES:
+            raise Ambiguous()
+        f.seek(10)
+        data = f.read(tag_size)
+        id_len, head_len = (3, 6) if version == 2 else (4, 10)
+        pos = 0
+        while pos + head_len <= len(data) and data[pos] != 0:
+            frame_id = data[pos:pos + id_len]
+            if version == 2:
+                size = int.from_bytes(data[pos + 3:pos + 6], 'big')
+            elif version == 3:
+                size = int.from_bytes(data[pos + 4:pos + 8], 'big')
+            else:
+                size = _id3_size(data[pos + 4:pos + 8])
+            if version != 2 and data[pos + 9] & (0x4f if version == 4 else 0xe0) and frame_id in ID3_FRAMES:
+                raise Ambiguous()  # Compressed, encrypted, grouped or unsynchronised frame
+            body = data[pos + head_len:pos + head_len + size]
+            if frame_id in EASY_ID3_FRAMES:
+                fields['_tagged'] = True
+            keyed = keyed or frame_id in EASY_ID3_KEYED
+            if frame_id in ID3_FRAMES and body:
+                _first(fields, ID3_FRAMES[frame_id], _decode_id3_text(body))
+            pos += head_len + size
+
+    if 'artist' not in fields or 'album' not in fields:
+        # mutagen fills frames missing from ID3v2 with those from an ID3v1 tag
+        f.seek(0, os.SEEK_END)
+        if f.tell() >= 128:
+            f.seek(-128, os.SEEK_END)
+            v1 = f.read(128)
+            if v1.startswith(b'TAG'):
+                fields['_tagged'] = True
+                _first(fields, 'artist', v1[33:63].split(b'\x00')[0].decode('latin-1').strip())
+                _first(fields, 'album', v1[63:93].split(b'\x00')[0].decode('latin-1').strip())
+    if keyed and not fields['_tagged']:
+        raise Ambiguous()
+    return fields
+
+
+def _parse_vorbis_comment(data):
+    fields = {'_tagged': False}
+    vendor_len = struct.unpack_from('<I', data, 0)[0]
+    pos = 4 + vendor_len
+    count = struct.unpack_from('<I', data, pos)[0]
+    pos += 4
+    for _ in range(count):
+        length = struct.unpack_from('<I', data, pos)[0]
+        if pos + 4 + length > len(data):
+            raise Ambiguous()  # Comment block was cut off by the read limit
+        key, _, value = data[pos + 4:pos + 4 + length].decode('utf-8').partition('=')
+        fields['_tagged'] = True
+        if key.upper() in VORBIS_KEYS:
+            _first(fields, VORBIS_KEYS[key.upper()], value)
+        pos += 4 + length
+    return fields
+
+
+def _read_flac(f, header):
+    start = 0
+    if header.startswith(b'ID3'):
+        start = 10 + _id3_size(header[6:10])
+    f.seek(start + 4)
+    while True:
+        block_header = f.read(4)
+        if len(block_header) < 4:
+            raise Ambiguous()
+        is_last, block_type = block_header[0] & 0x80, block_header[0] & 0x7f
+        length = int.from_bytes(block_header[1:], 'big')
+        if block_type == 4:  # VORBIS_COMMENT
+            if length > MAX_TAG_BYTES:
+                raise Ambiguous()
+            return _parse_vorbis_comment(f.read(length))
+        if is_last:
+            return {'_tagged': False}
+        f.seek(length, os.SEEK_CUR)  # Skip STREAMINFO, PICTURE etc. without reading them
+
+
+def _read_ogg(f, kind):
+    """Reassembles the second packet of the first logical stream, which holds the comments."""
+    f.seek(0)
+    packets, current, total = [], b'', 0
+    while len(packets) < 2:
+        page_header = f.read(27)
+        if len(page_header) < 27 or not page_header.startswith(b'OggS'):
+            raise Ambiguous()
+        lacing = f.read(page_header[26])
+        body = f.read(sum(lacing))
+        total += 27 + len(lacing) + len(body)
+        if total > MAX_TAG_BYTES:
+            raise Ambiguous()
+        pos = 0
+        for segment in lacing:
+            current += body[pos:pos + segment]
+            pos += segment
+            if segment < 255:
+                packets.append(current)
+                current = b''
+
+    magic = b'\x03vorbis' if kind == 'vorbis' else b'OpusTags'
+    if not packets[1].startswith(magic):
+        raise Ambiguous()
+    return _parse_vorbis_comment(packets[1][len(magic):])
+
+
+def _iter_atoms(f, start, end):
+    """Yields (name, data_start, data_end) for the atoms between `start` and `end`, seeking over their contents."""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, name = struct.unpack('>I4s', f.read(8))
+        data_start = pos + 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            data_start += 8
+        elif size == 0:
+            size = end - pos
+        if size < data_start - pos:
+            raise Ambiguous()
+        yield name, data_start, pos + size
+        pos += size
+
+
+def _find_atom(f, start, end, name):
+    for atom_name, data_start, data_end in _iter_atoms(f, start, end):
+        if atom_name == name:
+            return data_start, data_end
+    return None
+
+
+def _read_mp4(f):
+    f.seek(0, os.SEEK_END)
+    file_end = f.tell()
+    fields = {'_tagged': False}
+    span = (0, file_end)
+    for name, skip in ((b'moov', 0), (b'udta', 0), (b'meta', 4), (b'ilst', 0)):
+        span = _find_atom(f, span[0], span[1], name)
+        if span is None:
+            return fields
+        span = (span[0] + skip, span[1])  # 'meta' is a full atom with 4 bytes of version/flags
+
+    if span[1] - span[0] > MAX_TAG_BYTES:
+        raise Ambiguous()
+    keyed = False
+    for name, data_start, data_end in _iter_atoms(f, span[0], span[1]):
+        if name in EASY_MP4_ATOMS:
+            fields['_tagged'] = True
+        keyed = keyed or name in EASY_MP4_KEYED
+        if name not in MP4_ATOMS:
+            continue
+        data = _find_atom(f, data_start, data_end, b'data')
+        if data is None:
+            raise Ambiguous()
+        f.seek(data[0])
+        payload = f.read(data[1] - data[0])
+        if int.from_bytes(payload[1:4], 'big') != 1:
+            raise Ambiguous()  # Only plain UTF-8 text is handled here
+        _first(fields, MP4_ATOMS[name], payload[8:].decode('utf-8'))
+    if keyed and not fields['_tagged']:
+        raise Ambiguous()
+    return fields
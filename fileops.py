@@ -0,0 +1,219 @@
+# RhythmShelf File Operations
+# Version: 1.0.0
+# Author: Lewis
+#
+# This work is licensed under the MIT License.
+# See: https://opensource.org/licenses/MIT
+
+import errno
+import hashlib
+import os
+import queue
+import shutil
+import threading
+
+CHUNK_SIZE = 1024 * 1024  # Read in 1MB chunks
+
+
+def copy_file(source_path, destination_path, throttle=None, verify=False):
+    """Copies a file like shutil.copy2, pacing the data through `throttle` if given.
+
+    With `verify`, the MD5 of the data is computed as it streams through, the destination
+    is flushed to disk and its size checked, and the hash is returned. This replaces a
+    separate checksum pass that would read both copies again.
+    """
+    if throttle is not None:
+        throttle.file()
+    if not verify and (throttle is None or not throttle.limits_data):
+        shutil.copy2(source_path, destination_path)
+        return None
+
+    hasher = hashlib.md5() if verify else None
+    copied = 0
+    with open(source_path, 'rb') as src, open(destination_path, 'wb') as dst:
+        buf = src.read(CHUNK_SIZE)
+        while buf:
+            if throttle is not None:
+                throttle.data(len(buf))
+            if hasher is not None:
+                hasher.update(buf)
+            dst.write(buf)
+            copied += len(buf)
+            buf = src.read(CHUNK_SIZE)
+        if verify:
+            dst.flush()
+            os.fsync(dst.fileno())  # Surface write errors now rather than on close
+    shutil.copystat(source_path, destination_path)
+
+    if verify:
+        written = os.path.getsize(destination_path)
+        if written != copied or written != os.path.getsize(source_path):
+            raise IOError(f"Verification failed: wrote {written} of {copied} bytes")
+        return hasher.hexdigest()
+    return None
+
+
+def move_file(source_path, destination_path, throttle=None, verify=False):
+    """Moves a file like shutil.move. Same-device renames only count against the file
+    limit; cross-device moves are copied through the throttle.
+
+    With `verify`, returns the MD5 computed while a cross-device move was copied, or
+    None if the file was simply renamed.
+    """
+    if throttle is None and not verify:
+        shutil.move(source_path, destination_path)
+        return None
+
+    if throttle is not None:
+        throttle.file()
+        throttle = _DataOnly(throttle)
+    digests = []
+
+    def copy_function(src, dst):
+        digests.append(copy_file(src, dst, throttle, verify))
+
+    shutil.move(source_path, destination_path, copy_function=copy_function)
+    return digests[0] if digests else None
+
+
+def hash_file(path, throttle=None):
+    """Calculates the MD5 hash of a file."""
+    hasher = hashlib.md5()
+    if throttle is not None:
+        throttle.file()
+    with open(path, 'rb') as f:
+        buf = f.read(65536)  # Read in 64kb chunks
+        while len(buf) > 0:
+            if throttle is not None:
+                throttle.data(len(buf))
+            hasher.update(buf)
+            buf = f.read(65536)
+    return hasher.hexdigest()
+
+
+def files_equal(path1, path2, throttle=None):
+    """Compares two files byte for byte, like filecmp.cmp with shallow=False, pacing the
+    reads of both through `throttle` if given."""
+    if throttle is not None:
+        throttle.file()
+    with open(path1, 'rb') as f1, open(path2, 'rb') as f2:
+        if os.fstat(f1.fileno()).st_size != os.fstat(f2.fileno()).st_size:
+            return False
+        while True:
+            buf1, buf2 = f1.read(65536), f2.read(65536)
+            if throttle is not None:
+                throttle.data(len(buf1) + len(buf2))
+            if buf1 != buf2:
+                return False
+            if not buf1:
+                return True
+
+
+def partial_hash(path, throttle=None, chunk_size=65536):
+    """Calculates an MD5 of the file's size plus its first and last 64kb.
+
+    Cheap enough to fingerprint a whole library, but only a hint: equal partial hashes
+    still need a full comparison before the files can be treated as identical.
+    """
+    hasher = hashlib.md5()
+    if throttle is not None:
+        throttle.file()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        hasher.update(str(size).encode())
+        head = f.read(chunk_size)
+        tail = b''
+        if size > chunk_size * 2:
+            f.seek(-chunk_size, os.SEEK_END)
+            tail = f.read(chunk_size)
+        elif size > chunk_size:
+            tail = f.read()
+    if throttle is not None:
+        throttle.data(len(head) + len(tail))
+    hasher.update(head)
+    hasher.update(tail)
+    return hasher.hexdigest()
+
+
+def replace_with_hardlink(target_path, path):
+    """Atomically replaces `path` with a hardlink to `target_path`.
+
+    The link is created under a temporary name next to `path` and renamed over it, so
+    `path` always exists. Both files must be on the same device.
+    """
+    if os.path.exists(path) and os.path.samefile(target_path, path):
+        return  # Already linked; renaming a link over itself would leave the temp name behind
+    temp_path = f"{path}.rhythmshelf-link"
+    os.link(target_path, temp_path)
+    try:
+        os.replace(temp_path, path)
+    except OSError:
+        os.remove(temp_path)
+        raise
+
+
+class MovePipeline:
+    """Moves files to a destination folder as fast as the devices allow.
+
+    Files on the destination's device are renamed straight away on the calling thread.
+    Cross-device moves are full copies, so they're handed to a bounded pool of workers
+    instead; `submit` blocks once the pool is full rather than queuing without limit.
+    `on_done(source_path, destination_path, error)` is called for every file, from
+    whichever thread finished it.
+    """
+
+    def __init__(self, dest_folder, on_done, workers=4):
+        self.dest_dev = os.stat(dest_folder).st_dev
+        self.on_done = on_done
+        self._queue = queue.Queue(maxsize=workers * 2)
+        self._workers = [threading.Thread(target=self._copy_worker, daemon=True) for _ in range(workers)]
+        for thread in self._workers:
+            thread.start()
+
+    def submit(self, source_path, destination_path, source_dev=None):
+        if source_dev is None or source_dev == self.dest_dev:
+            try:
+                os.rename(source_path, destination_path)
+                self.on_done(source_path, destination_path, None)
+                return
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    self.on_done(source_path, destination_path, e)
+                    return
+        self._queue.put((source_path, destination_path))
+
+    def _copy_worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            source_path, destination_path = job
+            try:
+                shutil.move(source_path, destination_path)
+                self.on_done(source_path, destination_path, None)
+            except Exception as e:
+                self.on_done(source_path, destination_path, e)
+
+    def close(self):
+        """Waits for every queued cross-device move to finish."""
+        for _ in self._workers:
+            self._queue.put(None)
+        for thread in self._workers:
+            thread.join()
+
+
+class _DataOnly:
+    """Wraps a throttle so the file token already taken by move_file isn't taken twice."""
+
+    def __init__(self, throttle):
+        self.throttle = throttle
+
+    @property
+    def limits_data(self):
+        return self.throttle.limits_data
+
+    def file(self):
+        pass
+
+    def data(self, nbytes):
+        self.throttle.data(nbytes)
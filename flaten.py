@@ -6,17 +6,22 @@
 # See: https://opensource.org/licenses/MIT
 
 import os
-import shutil
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, ttk
 import threading
 import queue
+from collections import defaultdict
+
+from fileops import MovePipeline
+from reports import PLAN_FIELDS, REPORT_FILETYPES, ReportWriter
+from sniff import AUDIO_EXTENSIONS
 
 
 class MusicFlattenerGUI:
     """A simple GUI for flattening a music library into a single folder."""
     APP_VERSION = "1.0.0"
-    SUPPORTED_FORMATS = ('.mp3', '.flac', '.m4a', '.aac', '.ogg', '.wav', '.wma')
+    SUPPORTED_FORMATS = AUDIO_EXTENSIONS
+    COPY_WORKERS = 4  # Parallel copies for cross-device moves
 
     def __init__(self, root):
         self.root = root
@@ -28,6 +33,8 @@ class MusicFlattenerGUI:
         # --- Data ---
         self.source_dir = tk.StringVar()
         self.dest_dir = tk.StringVar()
+        self.plan_path = tk.StringVar()  # The plan is streamed here while flattening, if set
+        self.dry_run = tk.BooleanVar(value=False)
         self.status_text = tk.StringVar(value="Ready.")
         self.progress_var = tk.DoubleVar(value=0)
         self.processed_file_count = 0
@@ -63,6 +70,17 @@ class MusicFlattenerGUI:
         dest_entry.grid(row=1, column=1, sticky="ew", padx=10, pady=(5, 10))
         tk.Button(folders_frame, text="Browse...", command=self.select_dest_dir).grid(row=1, column=2, pady=(5, 10))
 
+        tk.Label(folders_frame, text="Save Plan To:", fg="white", bg="#2e2e2e", font=("Helvetica", 10)).grid(
+            row=2, column=0, sticky="w")
+        tk.Entry(folders_frame, textvariable=self.plan_path, state="readonly", width=60, readonlybackground="#555",
+                 fg="white").grid(row=2, column=1, sticky="ew", padx=10)
+        tk.Button(folders_frame, text="Browse...", command=self.select_plan_path).grid(row=2, column=2)
+        tk.Button(folders_frame, text="Clear", command=lambda: self.plan_path.set("")).grid(row=2, column=3,
+                                                                                            padx=(5, 0))
+        tk.Checkbutton(folders_frame, text="Dry run (plan only)", variable=self.dry_run, fg="white", bg="#2e2e2e",
+                       selectcolor="#1e1e1e", activebackground="#2e2e2e", activeforeground="white").grid(
+            row=3, column=1, sticky="w", padx=10, pady=(10, 0))
+
         # --- Start Button ---
         self.flatten_button = tk.Button(main_frame, text="🚀 Start Flattening", command=self.start_flattening_thread,
                                         bg="#4a4a4a", fg="white", font=("Helvetica", 12, "bold"), relief=tk.FLAT,
@@ -93,6 +111,11 @@ class MusicFlattenerGUI:
         path = filedialog.askdirectory(title="Select the destination folder for all music files")
         if path: self.dest_dir.set(path)
 
+    def select_plan_path(self):
+        path = filedialog.asksaveasfilename(title="Save the flatten plan as", defaultextension=".jsonl",
+                                            filetypes=REPORT_FILETYPES)
+        if path: self.plan_path.set(path)
+
     def start_flattening_thread(self):
         if self.is_running: return
 
@@ -104,6 +127,10 @@ class MusicFlattenerGUI:
         if source == dest:
             messagebox.showwarning("Warning", "Source and destination folders cannot be the same.")
             return
+        # Each decision is written out as it's made, so the plan can be reviewed elsewhere
+        plan = self.open_report(self.plan_path.get(), PLAN_FIELDS)
+        if plan is False:
+            return
 
         self.is_running = True
         self.flatten_button.config(state="disabled", text="🏃‍♂️ Processing...")
@@ -111,7 +138,8 @@ class MusicFlattenerGUI:
         self.progress_var.set(0)
         self.status_text.set("Scanning for music files...")
 
-        thread = threading.Thread(target=self.flatten_library_worker, args=(source, dest), daemon=True)
+        thread = threading.Thread(target=self.flatten_library_worker,
+                                  args=(source, dest, plan, self.dry_run.get()), daemon=True)
         thread.start()
 
     def process_log_queue(self):
@@ -142,53 +170,129 @@ class MusicFlattenerGUI:
         self.flatten_button.config(state="normal", text="🚀 Start Flattening")
         self.status_text.set(f"Finished. Moved {self.processed_file_count} files.")
 
-    def flatten_library_worker(self, source_folder, dest_folder):
+    @staticmethod
+    def open_report(path, fields):
+        """Opens the report at `path` on the GUI thread, so a bad location is reported before
+        the run starts. Returns None if no report was asked for, or False if it can't be written."""
+        if not path:
+            return None
+        try:
+            return ReportWriter(path, fields)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not write to '{path}':\n{e}")
+            return False
+
+    def flatten_library_worker(self, source_folder, dest_folder, plan=None, dry_run=False):
         self.processed_file_count = 0
 
-        # Pre-scan for progress bar
+        # Pre-scan for progress bar. The walk is kept so emptied folders can be pruned afterwards.
         files_to_move = []
-        for root, _, files in os.walk(source_folder):
+        walked_dirs = []  # (folder, subfolders, file count), parents before children
+        for root, dirs, files in os.walk(source_folder):
+            walked_dirs.append((root, [os.path.join(root, d) for d in dirs], len(files)))
+            root_dev = None
             for file in files:
                 if file.lower().endswith(self.SUPPORTED_FORMATS):
-                    files_to_move.append(os.path.join(root, file))
+                    if root_dev is None:
+                        try:
+                            root_dev = os.stat(root).st_dev  # One stat per folder decides rename vs copy
+                        except OSError:
+                            pass
+                    files_to_move.append((os.path.join(root, file), root_dev))
 
         total_files = len(files_to_move)
         if total_files == 0:
             self.log_message("No music files found in the source directory.")
+            if plan:
+                plan.close()
             self.log_queue.put("---DONE---")
             messagebox.showinfo("Finished", "No music files were found to process.")
             return
 
-        for i, source_path in enumerate(files_to_move):
+        planned_names = set()  # Moves finish out of order, so names already handed out are tracked here
+
+        lock = threading.Lock()
+        finished = [0]
+        moved_from = defaultdict(int)  # folder -> files successfully moved out of it
+
+        def on_moved(source_path, destination_path, error):
+            filename = os.path.basename(source_path)
+            with lock:
+                if error is None:
+                    self.processed_file_count += 1
+                    moved_from[os.path.dirname(source_path)] += 1
+                finished[0] += 1
+                self.progress_var.set((finished[0] / total_files) * 100)
+            if error is None:
+                self.log_message(f"Moved '{filename}'")
+            else:
+                self.log_message(f"❌ ERROR moving '{filename}': {error}")
+
+        pipeline = None if dry_run else MovePipeline(dest_folder, on_moved, workers=self.COPY_WORKERS)
+
+        for i, (source_path, source_dev) in enumerate(files_to_move):
             filename = os.path.basename(source_path)
             self.status_text.set(f"Moving {i + 1}/{total_files}: {filename}")
 
             # --- Safely handle filename collisions ---
             destination_path = os.path.join(dest_folder, filename)
             counter = 1
-            while os.path.exists(destination_path):
+            while destination_path in planned_names or os.path.exists(destination_path):
                 name, ext = os.path.splitext(filename)
                 new_filename = f"{name} ({counter}){ext}"
                 destination_path = os.path.join(dest_folder, new_filename)
                 counter += 1
+            planned_names.add(destination_path)
 
             if filename != os.path.basename(destination_path):
                 self.log_message(
                     f"⚠️ Renaming '{filename}' to '{os.path.basename(destination_path)}' to avoid overwrite.")
 
-            # --- Move the file ---
-            try:
-                shutil.move(source_path, destination_path)
-                self.log_message(f"Moved '{filename}'")
+            if plan:
+                plan.write(action="move", source=source_path, destination=destination_path)
+            if dry_run:
+                self.log_message(f"Would move '{filename}'")
                 self.processed_file_count += 1
-            except Exception as e:
-                self.log_message(f"❌ ERROR moving '{filename}': {e}")
-
-            self.progress_var.set(((i + 1) / total_files) * 100)
-
+                self.progress_var.set(((i + 1) / total_files) * 100)
+                continue
+
+            # --- Move the file: same-device renames happen now, cross-device copies in the pool ---
+            pipeline.submit(source_path, destination_path, source_dev)
+
+        if pipeline:
+            self.status_text.set("Finishing cross-device moves...")
+            pipeline.close()
+            pruned = self.prune_emptied_dirs(walked_dirs, moved_from)
+            if pruned:
+                self.log_message(f"Removed {pruned} emptied folders.")
+
+        if plan:
+            plan.close()
+            self.log_message(f"Plan saved to '{plan.path}'")
         self.log_queue.put("---DONE---")
         messagebox.showinfo("Success!", f"Flattening complete!\n\nMoved {self.processed_file_count} files.")
 
+    @staticmethod
+    def prune_emptied_dirs(walked_dirs, moved_from):
+        """Removes the folders this run emptied, in one bottom-up pass over the original walk.
+
+        A folder is only removed if every file in it was moved out and every subfolder was
+        removed, so folders that were already empty or still hold other files are left alone
+        and nothing needs to be listed again.
+        """
+        pruned = set()
+        for folder, subfolders, file_count in reversed(walked_dirs[1:]):  # Never the source folder itself
+            if not file_count and not subfolders:
+                continue  # Was empty before the run
+            if moved_from.get(folder, 0) < file_count or not pruned.issuperset(subfolders):
+                continue
+            try:
+                os.rmdir(folder)
+                pruned.add(folder)
+            except OSError:
+                pass  # Something new appeared in it
+        return len(pruned)
+
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -6,13 +6,18 @@
 # See: https://opensource.org/licenses/MIT
 
 import os
-import shutil
-import mutagen
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, ttk
 import threading
 import queue
 
+from checksums import HashManifest, LibraryIndex
+from fasttags import read_sort_tags
+from fileops import copy_file, move_file, replace_with_hardlink
+from reports import PLAN_FIELDS, REPORT_FILETYPES, ReportWriter
+from scan import scan_files
+from throttle import Throttle, parse_limit, set_idle_priority
+
 
 class MusicOrganizerGUI:
     """A simple GUI for organizing a music library."""
@@ -21,18 +26,31 @@ class MusicOrganizerGUI:
     def __init__(self, root):
         self.root = root
         self.root.title(f"🎵 RhythmShelf v{self.APP_VERSION}")
-        self.root.geometry("700x600")
+        self.root.geometry("700x720")
         self.root.minsize(600, 450)
         self.root.configure(bg="#2e2e2e")
 
         # --- Data ---
-        self.source_dir = tk.StringVar()
+        self.source_dir = tk.StringVar()  # Display text for source_dirs
+        self.source_dirs = []
         self.dest_dir = tk.StringVar()
         self.operation_mode = tk.StringVar(value="copy")  # 'copy' or 'move'
+        self.verify_copies = tk.BooleanVar(value=False)
+        self.plan_path = tk.StringVar()  # The plan is streamed here while organizing, if set
+        self.dry_run = tk.BooleanVar(value=False)
+        self.existing_mode = tk.StringVar(value="copy")  # What to do with files already in the library
         self.status_text = tk.StringVar(value="Ready.")
         self.progress_var = tk.DoubleVar(value=0)
         self.processed_file_count = 0
 
+        # --- Throttling (adjustable while a run is in progress) ---
+        self.max_mb_per_sec = tk.StringVar(value="0")
+        self.max_files_per_sec = tk.StringVar(value="0")
+        self.idle_priority = tk.BooleanVar(value=False)
+        self.throttle = Throttle()
+        self.max_mb_per_sec.trace_add("write", self.update_throttle)
+        self.max_files_per_sec.trace_add("write", self.update_throttle)
+
         self.is_running = False
         self.log_queue = queue.Queue()
 
@@ -50,12 +68,14 @@ class MusicOrganizerGUI:
         folders_frame.pack(fill=tk.X)
         folders_frame.columnconfigure(1, weight=1)
 
-        tk.Label(folders_frame, text="Source Music Folder:", fg="white", bg="#2e2e2e", font=("Helvetica", 10)).grid(
+        tk.Label(folders_frame, text="Source Music Folders:", fg="white", bg="#2e2e2e", font=("Helvetica", 10)).grid(
             row=0, column=0, sticky="w", pady=(0, 5))
         source_entry = tk.Entry(folders_frame, textvariable=self.source_dir, state="readonly", width=60,
                                 readonlybackground="#555", fg="white")
         source_entry.grid(row=0, column=1, sticky="ew", padx=10, pady=(0, 5))
-        tk.Button(folders_frame, text="Browse...", command=self.select_source_dir).grid(row=0, column=2, pady=(0, 5))
+        tk.Button(folders_frame, text="Add...", command=self.select_source_dir).grid(row=0, column=2, pady=(0, 5))
+        tk.Button(folders_frame, text="Clear", command=self.clear_source_dirs).grid(row=0, column=3, padx=(5, 0),
+                                                                                    pady=(0, 5))
 
         tk.Label(folders_frame, text="Destination Folder:", fg="white", bg="#2e2e2e", font=("Helvetica", 10)).grid(
             row=1, column=0, sticky="w", pady=(5, 10))
@@ -64,6 +84,14 @@ class MusicOrganizerGUI:
         dest_entry.grid(row=1, column=1, sticky="ew", padx=10, pady=(5, 10))
         tk.Button(folders_frame, text="Browse...", command=self.select_dest_dir).grid(row=1, column=2, pady=(5, 10))
 
+        tk.Label(folders_frame, text="Save Plan To:", fg="white", bg="#2e2e2e", font=("Helvetica", 10)).grid(
+            row=2, column=0, sticky="w")
+        tk.Entry(folders_frame, textvariable=self.plan_path, state="readonly", width=60, readonlybackground="#555",
+                 fg="white").grid(row=2, column=1, sticky="ew", padx=10)
+        tk.Button(folders_frame, text="Browse...", command=self.select_plan_path).grid(row=2, column=2)
+        tk.Button(folders_frame, text="Clear", command=lambda: self.plan_path.set("")).grid(row=2, column=3,
+                                                                                            padx=(5, 0))
+
         # --- Options ---
         options_frame = tk.LabelFrame(main_frame, text="Options", fg="white", bg="#2e2e2e", padx=10, pady=10)
         options_frame.pack(fill=tk.X, pady=10)
@@ -72,6 +100,35 @@ class MusicOrganizerGUI:
                        bg="#2e2e2e", fg="white", selectcolor="#444").pack(side=tk.LEFT, padx=10)
         tk.Radiobutton(options_frame, text="Move files (Faster)", variable=self.operation_mode, value="move",
                        bg="#2e2e2e", fg="white", selectcolor="#444").pack(side=tk.LEFT, padx=10)
+        tk.Checkbutton(options_frame, text="Verify copies (hash while copying)", variable=self.verify_copies,
+                       fg="white", bg="#2e2e2e", selectcolor="#1e1e1e", activebackground="#2e2e2e",
+                       activeforeground="white").pack(side=tk.LEFT, padx=10)
+        tk.Checkbutton(options_frame, text="Dry run (plan only)", variable=self.dry_run, fg="white", bg="#2e2e2e",
+                       selectcolor="#1e1e1e", activebackground="#2e2e2e", activeforeground="white").pack(
+            side=tk.LEFT, padx=10)
+
+        # --- Already in Library ---
+        existing_frame = tk.LabelFrame(main_frame, text="Files Already in Destination Library", fg="white",
+                                       bg="#2e2e2e", padx=10, pady=10)
+        existing_frame.pack(fill=tk.X, pady=(0, 10))
+
+        for text, value in (("Import anyway", "copy"), ("Skip", "skip"), ("Hardlink to existing copy", "hardlink")):
+            tk.Radiobutton(existing_frame, text=text, variable=self.existing_mode, value=value, bg="#2e2e2e",
+                           fg="white", selectcolor="#444").pack(side=tk.LEFT, padx=10)
+
+        # --- Throttle ---
+        throttle_frame = tk.LabelFrame(main_frame, text="Throttle (0 = unlimited)", fg="white", bg="#2e2e2e", padx=10,
+                                       pady=10)
+        throttle_frame.pack(fill=tk.X)
+
+        tk.Label(throttle_frame, text="Max MB/s:", fg="white", bg="#2e2e2e").pack(side=tk.LEFT)
+        tk.Entry(throttle_frame, textvariable=self.max_mb_per_sec, width=6, bg="#555", fg="white").pack(
+            side=tk.LEFT, padx=(5, 15))
+        tk.Label(throttle_frame, text="Max files/s:", fg="white", bg="#2e2e2e").pack(side=tk.LEFT)
+        tk.Entry(throttle_frame, textvariable=self.max_files_per_sec, width=6, bg="#555", fg="white").pack(
+            side=tk.LEFT, padx=(5, 15))
+        tk.Checkbutton(throttle_frame, text="Idle priority", variable=self.idle_priority, fg="white", bg="#2e2e2e",
+                       selectcolor="#1e1e1e", activebackground="#2e2e2e", activeforeground="white").pack(side=tk.LEFT)
 
         # --- Start Button ---
         self.organize_button = tk.Button(main_frame, text="🚀 Start Organizing", command=self.start_organization_thread,
@@ -96,13 +153,27 @@ class MusicOrganizerGUI:
                  fg="white").pack(side=tk.BOTTOM, fill=tk.X)
 
     def select_source_dir(self):
-        path = filedialog.askdirectory(title="Select your music folder")
-        if path: self.source_dir.set(path)
+        path = filedialog.askdirectory(title="Add a music folder")
+        if path and path not in self.source_dirs:
+            self.source_dirs.append(path)
+            self.source_dir.set("; ".join(self.source_dirs))
+
+    def clear_source_dirs(self):
+        self.source_dirs = []
+        self.source_dir.set("")
 
     def select_dest_dir(self):
         path = filedialog.askdirectory(title="Select where to save the organized library")
         if path: self.dest_dir.set(path)
 
+    def select_plan_path(self):
+        path = filedialog.asksaveasfilename(title="Save the organize plan as", defaultextension=".jsonl",
+                                            filetypes=REPORT_FILETYPES)
+        if path: self.plan_path.set(path)
+
+    def update_throttle(self, *_):
+        self.throttle.set_limits(parse_limit(self.max_mb_per_sec.get()), parse_limit(self.max_files_per_sec.get()))
+
     def sanitize_foldername(self, name):
         """Removes characters from a string that are invalid for folder names."""
         if not name: return ""
@@ -112,17 +183,70 @@ class MusicOrganizerGUI:
             name = name.replace(char, '')
         return name.strip('. ')
 
+    @staticmethod
+    def list_subfolders(path):
+        """Maps the case-folded name of each folder inside `path` to its name on disk."""
+        try:
+            with os.scandir(path) as entries:
+                return {entry.name.casefold(): entry.name for entry in entries if entry.is_dir()}
+        except OSError:
+            return {}
+
+    def prepare_album_dirs(self, dest_folder, albums, create=True):
+        """Maps each (artist, album) folder name pair to its folder under dest_folder,
+        creating any that are missing in one batch. `albums` is iterated in order, so pass
+        the pairs in the order their files were found.
+
+        Names that differ only by case ("The Beatles" and "the beatles") share one folder,
+        using the spelling already on disk or else the first one seen. The existing tree is
+        learned from one listing of dest_folder plus one per existing artist folder, so no
+        per-file stat or makedirs calls are needed.
+        """
+        artist_names = self.list_subfolders(dest_folder)
+        existing_artists = set(artist_names.values())
+        album_names = {}  # artist folder -> {case-folded album: album folder}
+        album_dirs, to_create = {}, []
+
+        for artist, album in albums:
+            artist_folder = artist_names.setdefault(artist.casefold(), artist)
+            artist_dir = os.path.join(dest_folder, artist_folder)
+            if artist_folder not in album_names:
+                if artist_folder in existing_artists:
+                    album_names[artist_folder] = self.list_subfolders(artist_dir)
+                else:
+                    album_names[artist_folder] = {}
+                    to_create.append(artist_dir)
+            known_albums = album_names[artist_folder]
+            if album.casefold() not in known_albums:
+                known_albums[album.casefold()] = album
+                to_create.append(os.path.join(artist_dir, album))
+            album_dirs[(artist, album)] = os.path.join(artist_dir, known_albums[album.casefold()])
+
+        if create:
+            for folder in to_create:  # Artist folders come before their albums
+                try:
+                    os.mkdir(folder)
+                except FileExistsError:
+                    pass
+                except OSError as e:
+                    self.log_message(f"❌ ERROR creating folder '{os.path.relpath(folder, dest_folder)}': {e}")
+        return album_dirs
+
     def start_organization_thread(self):
         if self.is_running: return
 
-        source, dest = self.source_dir.get(), self.dest_dir.get()
+        sources, dest = list(self.source_dirs), self.dest_dir.get()
 
-        if not source or not dest:
+        if not sources or not dest:
             messagebox.showerror("Error", "Please select both a source and a destination folder.")
             return
-        if source == dest:
+        if dest in sources:
             messagebox.showwarning("Warning", "Source and destination folders cannot be the same.")
             return
+        # Each decision is written out as it's made, so the plan can be reviewed elsewhere
+        plan = self.open_report(self.plan_path.get(), PLAN_FIELDS)
+        if plan is False:
+            return
 
         self.is_running = True
         self.organize_button.config(state="disabled", text="🏃‍♂️ Processing...")
@@ -130,7 +254,11 @@ class MusicOrganizerGUI:
         self.progress_var.set(0)
         self.status_text.set("Preparing to organize...")
 
-        thread = threading.Thread(target=self.organize_files, args=(source, dest, self.operation_mode.get()),
+        self.update_throttle()
+        thread = threading.Thread(target=self.organize_files,
+                                  args=(sources, dest, self.operation_mode.get(), self.idle_priority.get(),
+                                        self.verify_copies.get(), plan, self.dry_run.get(),
+                                        self.existing_mode.get()),
                                   daemon=True)
         thread.start()
 
@@ -163,59 +291,176 @@ class MusicOrganizerGUI:
         self.organize_button.config(state="normal", text="🚀 Start Organizing")
         self.status_text.set(f"Finished. Processed {self.processed_file_count} files.")
 
-    def organize_files(self, source_folder, dest_folder, operation):
-        self.processed_file_count = 0
+    @staticmethod
+    def open_report(path, fields):
+        """Opens the report at `path` on the GUI thread, so a bad location is reported before
+        the run starts. Returns None if no report was asked for, or False if it can't be written."""
+        if not path:
+            return None
+        try:
+            return ReportWriter(path, fields)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not write to '{path}':\n{e}")
+            return False
 
-        # Pre-scan to get total file count for the progress bar
-        files_to_process = [f for f in os.listdir(source_folder) if os.path.isfile(os.path.join(source_folder, f))]
+    def organize_files(self, source_folders, dest_folder, operation, idle_priority=False, verify=False, plan=None,
+                       dry_run=False, existing="copy"):
+        self.processed_file_count = 0
+        if idle_priority:
+            if set_idle_priority():
+                self.log_message("Running at idle priority.")
+            else:
+                self.log_message("⚠️ Idle priority isn't available on this system; running at normal priority.")
+        # Hashes computed during verified copies are kept for the duplicate finder
+        manifest = HashManifest(dest_folder) if verify else None
+
+        # Pre-scan to get total file count for the progress bar; all source folders are listed concurrently
+        files_to_process = [path for _, path, _ in scan_files(source_folders, recursive=False, idle_priority=idle_priority)]
         total_files = len(files_to_process)
         if total_files == 0:
             self.log_message("No files found in the source directory.")
+            if plan:
+                plan.close()
             self.log_queue.put("---DONE---")
             messagebox.showinfo("Finished", "No files were found to process.")
             return
 
         operation_verb = "Copying" if operation == "copy" else "Moving"
         operation_past_tense = "Copied" if operation == "copy" else "Moved"
-
-        for i, filename in enumerate(files_to_process):
-            source_path = os.path.join(source_folder, filename)
-            self.status_text.set(f"{operation_verb} {i + 1}/{total_files}: {filename}")
+        if dry_run:
+            operation_verb, operation_past_tense = "Planning", f"Would {operation}"
+        # Overlapping imports: spot files whose content is already in the library
+        index = None
+        if existing != "copy":
+            self.status_text.set("Indexing destination library...")
+            index = LibraryIndex(dest_folder, self.throttle, idle_priority, read_only=dry_run)
+        existing_count, bytes_saved = 0, 0
+
+        # Pass 1: read the tags of every file. Sanitised names are memoised, since most
+        # files share their artist and album with the files next to them.
+        sane_names = {}
+        entries = []  # (source_path, filename, sane_artist, sane_album)
+        for i, source_path in enumerate(files_to_process):
+            filename = os.path.basename(source_path)
+            self.status_text.set(f"Reading tags {i + 1}/{total_files}: {filename}")
 
             artist_name, album_name = "Unknown Artist", "Unknown Album"
             try:
-                audio = mutagen.File(source_path, easy=True)
-                if not audio: raise ValueError("Not a supported audio file.")
-                artist_name = audio.get('artist', ['Unknown Artist'])[0]
-                album_name = audio.get('album', ['Unknown Album'])[0]
+                # Only the artist and album are needed, so read just those rather than the full tag model
+                tags = read_sort_tags(source_path)
+                if tags is None:
+                    # Cover art, .cue, .log, .nfo etc. are recognised and left alone
+                    self.log_message(f"Skipping '{filename}': Not an audio file.")
+                    if plan:
+                        plan.write(action="skip", source=source_path)
+                    self.progress_var.set(((i + 1) / total_files) * 50)
+                    continue
+                artist_name = tags[0] or "Unknown Artist"
+                album_name = tags[1] or "Unknown Album"
             except Exception as e:
                 self.log_message(f"⚠️ Skipping '{filename}': Could not read tags.")
                 artist_name, album_name = "Untagged", "Untagged Files"
 
-            sane_artist = self.sanitize_foldername(artist_name)
-            sane_album = self.sanitize_foldername(album_name)
-
-            artist_dir = os.path.join(dest_folder, sane_artist)
-            album_dir = os.path.join(artist_dir, sane_album)
-            os.makedirs(album_dir, exist_ok=True)
-
+            for name in (artist_name, album_name):
+                if name not in sane_names:
+                    sane_names[name] = self.sanitize_foldername(name)
+            entries.append((source_path, filename, sane_names[artist_name], sane_names[album_name]))
+            self.progress_var.set(((i + 1) / total_files) * 50)
+
+        # Every destination folder is known now, so they're all created up front in one batch
+        self.status_text.set("Creating destination folders...")
+        albums = dict.fromkeys((artist, album) for _, _, artist, album in entries)  # In first-seen order
+        album_dirs = self.prepare_album_dirs(dest_folder, albums, create=not dry_run)
+
+        # Pass 2: copy or move. Files from different source folders can share a name and
+        # album, so names already handed out in this run are tracked to avoid overwriting them.
+        total_entries = len(entries)
+        planned_names = set()  # Case-folded, since case-insensitive file systems treat them as one
+        for i, (source_path, filename, sane_artist, sane_album) in enumerate(entries):
+            self.status_text.set(f"{operation_verb} {i + 1}/{total_entries}: {filename}")
+            album_dir = album_dirs[(sane_artist, sane_album)]
             destination_path = os.path.join(album_dir, filename)
+            relative_dir = os.path.relpath(album_dir, dest_folder).replace(os.sep, '/')
+
+            size, match = 0, None
+            if index is not None:
+                try:
+                    size = os.path.getsize(source_path)
+                    match = index.find(source_path, size)
+                except OSError:
+                    pass  # Fall back to importing it normally
+            if match and (existing == "skip" or os.path.abspath(match) == os.path.abspath(destination_path)):
+                if plan:
+                    plan.write(action="skip", source=source_path, destination=match)
+                self.log_message(f"Skipped '{filename}': Already in library as '{os.path.relpath(match, dest_folder)}'")
+                existing_count += 1
+                bytes_saved += size
+                self.progress_var.set(50 + ((i + 1) / total_entries) * 50)
+                continue
+
+            counter = 1
+            while destination_path.casefold() in planned_names:
+                name, ext = os.path.splitext(filename)
+                destination_path = os.path.join(album_dir, f"{name} ({counter}){ext}")
+                counter += 1
+            planned_names.add(destination_path.casefold())
+            if counter > 1:
+                self.log_message(
+                    f"⚠️ Renaming '{filename}' to '{os.path.basename(destination_path)}' to avoid overwrite.")
+
+            if match:
+                relative_match = os.path.relpath(match, dest_folder)
+                if plan:
+                    plan.write(action="hardlink", source=source_path, destination=destination_path)
+                try:
+                    if not dry_run:
+                        replace_with_hardlink(match, destination_path)
+                        index.add(destination_path, size)
+                    self.log_message(f"Hardlinked '{filename}' to existing '{relative_match}'")
+                    existing_count += 1
+                    bytes_saved += size
+                except OSError as e:
+                    self.log_message(f"❌ ERROR linking '{filename}': {e}")
+                self.progress_var.set(50 + ((i + 1) / total_entries) * 50)
+                continue
+
+            if plan:
+                plan.write(action=operation, source=source_path, destination=destination_path)
+            if dry_run:
+                self.log_message(f"{operation_past_tense} '{filename}' to '{relative_dir}/'")
+                self.processed_file_count += 1
+                self.progress_var.set(50 + ((i + 1) / total_entries) * 50)
+                continue
+
             try:
                 if operation == "copy":
-                    shutil.copy2(source_path, destination_path)  # copy2 preserves metadata
+                    # Preserves metadata like copy2
+                    digest = copy_file(source_path, destination_path, self.throttle, verify)
                 else:
-                    shutil.move(source_path, destination_path)
-
-                self.log_message(f"{operation_past_tense} '{filename}' to '{sane_artist}/{sane_album}/'")
+                    digest = move_file(source_path, destination_path, self.throttle, verify)
+                if digest:
+                    manifest.add(destination_path, digest)
+                if index is not None:
+                    index.add(destination_path, size)  # Later files in this batch can match it too
+
+                verified = " (verified)" if digest else ""
+                self.log_message(f"{operation_past_tense} '{filename}' to '{relative_dir}/'{verified}")
                 self.processed_file_count += 1
             except Exception as e:
                 self.log_message(f"❌ ERROR with '{filename}': {e}")
 
-            self.progress_var.set(((i + 1) / total_files) * 100)
+            self.progress_var.set(50 + ((i + 1) / total_entries) * 50)
 
+        summary = f"{operation_past_tense} {self.processed_file_count} files."
+        if existing_count:
+            summary += (f"\n{existing_count} files were already in the library "
+                        f"({bytes_saved / 1024 / 1024:.2f} MB saved).")
+            self.log_message(summary.splitlines()[-1])
+        if plan:
+            plan.close()
+            self.log_message(f"Plan saved to '{plan.path}'")
         self.log_queue.put("---DONE---")
-        messagebox.showinfo("Success!",
-                            f"Organization complete!\n\n{operation_past_tense} {self.processed_file_count} files.")
+        messagebox.showinfo("Success!", f"Organization complete!\n\n{summary}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+# RhythmShelf Reports
+# Version: 1.0.0
+# Author: Lewis
+#
+# This work is licensed under the MIT License.
+# See: https://opensource.org/licenses/MIT
+
+import csv
+import json
+
+DUPLICATE_FIELDS = ('set', 'md5', 'size', 'path', 'mtime_ns', 'inode')
+PLAN_FIELDS = ('action', 'source', 'destination')
+REPORT_FILETYPES = [("JSON Lines", "*.jsonl"), ("CSV", "*.csv")]
+
+
+class ReportWriter:
+    """Streams report rows to disk as they're produced, as JSON lines or CSV depending on
+    the file extension. Each row is flushed straight away so nothing piles up in memory
+    and a report is usable even if the run is interrupted."""
+
+    def __init__(self, path, fields):
+        self.path = path
+        self.fields = fields
+        self.is_csv = path.lower().endswith('.csv')
+        self._file = open(path, 'w', encoding='utf-8', newline='')
+        if self.is_csv:
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(fields)
+
+    def write(self, **row):
+        if self.is_csv:
+            self._csv.writerow([row.get(field, '') for field in self.fields])
+        else:
+            self._file.write(json.dumps({field: row.get(field) for field in self.fields}, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def read_report(path):
+    """Yields each row of a report written by ReportWriter as a dict."""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.lower().endswith('.csv'):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def write_duplicate_set(writer, set_number, md5, size, files):
+    """Writes a row for each (path, mtime_ns, inode) in `files`. The modification time and
+    inode let a reloaded report spot files changed since they were hashed."""
+    for path, mtime_ns, inode in files:
+        writer.write(set=set_number, md5=md5, size=size, path=path, mtime_ns=mtime_ns, inode=inode)
+
+
+def _optional_int(value):
+    return int(value) if value not in (None, '') else None
+
+
+def read_duplicate_sets(path):
+    """Yields (size, files) for each set in a saved duplicate report, where files are
+    (path, mtime_ns, inode) tuples; the last two are None in reports that predate them.
+    Rows are written as duplicates are found, so a set's rows needn't be next to each other."""
+    sets = {}
+    for row in read_report(path):
+        size, files = sets.setdefault(str(row['set']), (int(row['size']), []))
+        files.append((row['path'], _optional_int(row.get('mtime_ns')), _optional_int(row.get('inode'))))
+    yield from sets.values()
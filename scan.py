@@ -0,0 +1,99 @@
+# RhythmShelf Scanner
+# Version: 1.0.0
+# Author: Lewis
+#
+# This work is licensed under the MIT License.
+# See: https://opensource.org/licenses/MIT
+
+import os
+import queue
+import threading
+
+from throttle import set_idle_priority
+
+WORKERS_PER_ROOT = 4
+_DONE = object()
+
+
+def normalize_roots(roots):
+    """Returns the distinct absolute roots, dropping any that sit inside another root
+    so no file is scanned twice."""
+    roots = sorted({os.path.abspath(r) for r in roots if r})
+    kept = []
+    for root in roots:
+        if not any(root == k or root.startswith(k.rstrip(os.sep) + os.sep) for k in kept):
+            kept.append(root)
+    return kept
+
+
+def scan_files(roots, recursive=True, with_stat=False, workers_per_root=WORKERS_PER_ROOT, idle_priority=False):
+    """Walks several folders concurrently and yields (root, path, stat) for every file.
+
+    Each root gets its own pool of workers listing directories in parallel, so a slow
+    network mount doesn't hold up local disks and its listing latency overlaps. `stat`
+    is None unless `with_stat` is set, in which case a full os.stat is fetched on the
+    worker too. Files are yielded as they're found, in no particular order. Like os.walk, symlinked
+    directories are not followed and unreadable directories are skipped. With
+    `idle_priority`, each worker lowers its own priority, since not every platform passes
+    it on to new threads.
+    """
+    roots = normalize_roots(roots)
+    results = queue.Queue()
+    threads = []
+    for root in roots:
+        threads.extend(_start_root(root, recursive, with_stat, workers_per_root, results, idle_priority))
+
+    def wait_for_workers():
+        for thread in threads:
+            thread.join()
+        results.put(_DONE)
+
+    threading.Thread(target=wait_for_workers, daemon=True).start()
+    while True:
+        item = results.get()
+        if item is _DONE:
+            return
+        yield item
+
+
+def _start_root(root, recursive, with_stat, workers, results, idle_priority=False):
+    dirs = queue.Queue()
+    dirs.put(root)
+    pending = [1]  # Directories queued or being listed
+    lock = threading.Lock()
+
+    def worker():
+        if idle_priority:
+            set_idle_priority()
+        while True:
+            folder = dirs.get()
+            if folder is None:
+                return
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if recursive:
+                                    with lock:
+                                        pending[0] += 1
+                                    dirs.put(entry.path)
+                            elif entry.is_file():
+                                # DirEntry.stat() leaves st_ino/st_dev/st_nlink at 0 on Windows, which
+                                # callers rely on to spot hardlinks, so always take a full stat
+                                results.put((root, entry.path, os.stat(entry.path) if with_stat else None))
+                        except OSError:
+                            continue  # Skip inaccessible files
+            except OSError:
+                pass  # Skip unreadable directories
+            with lock:
+                pending[0] -= 1
+                finished = pending[0] == 0
+            if finished:
+                for _ in range(workers):
+                    dirs.put(None)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    return threads
@@ -0,0 +1,128 @@
+# RhythmShelf Format Sniffer
+# Version: 1.0.0
+# Author: Lewis
+#
+# This work is licensed under the MIT License.
+# See: https://opensource.org/licenses/MIT
+
+import mutagen
+from mutagen.aac import AAC
+from mutagen.aiff import AIFF
+from mutagen.asf import ASF
+from mutagen.easymp4 import EasyMP4
+from mutagen.flac import FLAC
+from mutagen.mp3 import MP3, EasyMP3
+from mutagen.mp4 import MP4
+from mutagen.oggflac import OggFLAC
+from mutagen.oggopus import OggOpus
+from mutagen.oggspeex import OggSpeex
+from mutagen.oggvorbis import OggVorbis
+from mutagen.wave import WAVE
+
+AUDIO_EXTENSIONS = ('.mp3', '.flac', '.m4a', '.aac', '.ogg', '.wav', '.wma', '.opus', '.aiff', '.aif')
+
+# Files that are certainly not audio, so mutagen's full probe can be skipped. Anything
+# else with an unrecognised header still goes to mutagen.File, which knows more formats
+# (WavPack, APE, Musepack, TTA, DSF...) than are sniffed here.
+NON_AUDIO_EXTENSIONS = ('.cue', '.log', '.nfo', '.txt', '.m3u', '.m3u8', '.pls', '.sfv', '.md5',
+                        '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.pdf')
+NON_AUDIO_MAGIC = (b'\xff\xd8\xff', b'\x89PNG', b'GIF87a', b'GIF89a', b'%PDF')
+
+HEADER_SIZE = 64
+ASF_GUID = b'\x30\x26\xb2\x75\x8e\x66\xcf\x11\xa6\xd9\x00\xaa\x00\x62\xce\x6c'
+OGG_CODECS = ((b'\x01vorbis', 'vorbis'), (b'OpusHead', 'opus'), (b'\x7fFLAC', 'oggflac'), (b'Speex   ', 'speex'))
+
+# Format name -> (mutagen class, easy-tag class)
+FORMAT_CLASSES = {
+    'mp3': (MP3, EasyMP3),
+    'aac': (AAC, AAC),
+    'flac': (FLAC, FLAC),
+    'vorbis': (OggVorbis, OggVorbis),
+    'opus': (OggOpus, OggOpus),
+    'oggflac': (OggFLAC, OggFLAC),
+    'speex': (OggSpeex, OggSpeex),
+    'mp4': (MP4, EasyMP4),
+    'wave': (WAVE, WAVE),
+    'aiff': (AIFF, AIFF),
+    'asf': (ASF, ASF),
+}
+
+
+def sniff_header(header, f=None, path=None):
+    """Identifies an audio format from the first bytes of a file.
+
+    Returns a key of FORMAT_CLASSES, or None if the header isn't a recognised audio
+    format. `f` is the open file, used only to look past a leading ID3v2 tag. A bare
+    MPEG frame header is only two bytes of magic, so when `path` is given it's only
+    trusted on a file with an audio extension.
+    """
+    if header.startswith(b'ID3') and len(header) >= 10:
+        # An ID3v2 tag normally means MP3, but FLAC files are sometimes tagged this way too
+        if f is not None:
+            tag_size = ((header[6] & 0x7f) << 21 | (header[7] & 0x7f) << 14 |
+                        (header[8] & 0x7f) << 7 | (header[9] & 0x7f))
+            f.seek(10 + tag_size)
+            if f.read(4) == b'fLaC':
+                return 'flac'
+        return 'mp3'
+    if header.startswith(b'fLaC'):
+        return 'flac'
+    if header.startswith(b'OggS') and len(header) > 27:
+        packet = header[27 + header[26]:]
+        for magic, name in OGG_CODECS:
+            if packet.startswith(magic):
+                return name
+        return None
+    if header[4:8] == b'ftyp':
+        return 'mp4'
+    if header.startswith(b'RIFF') and header[8:12] == b'WAVE':
+        return 'wave'
+    if header.startswith(b'FORM') and header[8:12] in (b'AIFF', b'AIFC'):
+        return 'aiff'
+    if header.startswith(ASF_GUID):
+        return 'asf'
+    if path is None or is_audio_extension(path):
+        return _sniff_frame_header(header)
+    return None
+
+
+def _sniff_frame_header(header):
+    """Recognises a bare MPEG audio or ADTS AAC frame header, checking the fields that
+    can't be valid so text like a UTF-16 byte order mark (FF FE) isn't taken as audio."""
+    if len(header) < 3 or header[0] != 0xff or header[1] & 0xe0 != 0xe0:
+        return None
+    if header[1] & 0x06 == 0:
+        # Layer bits of 00 mean an ADTS AAC stream: a 12 bit sync word and a sample rate index of 0-12
+        if header[1] & 0xf0 == 0xf0 and (header[2] >> 2) & 0x0f <= 12:
+            return 'aac'
+        return None
+    # MPEG version 01 is reserved, as are bitrate indexes 0 (free format) and 15 and sample rate index 3
+    if (header[1] >> 3) & 0x03 == 1 or header[2] >> 4 in (0, 15) or (header[2] >> 2) & 0x03 == 3:
+        return None
+    return 'mp3'
+
+
+def is_audio_extension(filename):
+    return filename.lower().endswith(AUDIO_EXTENSIONS)
+
+
+def is_non_audio(filename, header):
+    """True if the file is certainly not audio, from its extension or its first bytes."""
+    return filename.lower().endswith(NON_AUDIO_EXTENSIONS) or header.startswith(NON_AUDIO_MAGIC)
+
+
+def open_audio(path, easy=False):
+    """Opens `path` with the mutagen class matching its header, like mutagen.File.
+
+    Returns None without parsing anything if the file is certainly not audio. Any other
+    file with an unrecognised header still goes through mutagen.File's full probe.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+        kind = sniff_header(header, f, path)
+    if kind is None:
+        if is_non_audio(path, header):
+            return None
+        return mutagen.File(path, easy=easy)
+    plain, easy_class = FORMAT_CLASSES[kind]
+    return (easy_class if easy else plain)(path)
@@ -6,20 +6,19 @@
 # See: https://opensource.org/licenses/MIT
 
 import os
-import mutagen
 from mutagen.easyid3 import EasyID3
-from mutagen.flac import FLAC
-from mutagen.mp4 import MP4
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, ttk
 import threading
 import queue
 
+from sniff import AUDIO_EXTENSIONS, open_audio
+
 
 class MusicTaggerGUI:
     """A GUI to tag music files based on their filename structure."""
     APP_VERSION = "1.2.0"
-    DEFAULT_FORMATS = ".mp3 .flac .m4a .aac .ogg .wav .wma .opus .aiff .aif"
+    DEFAULT_FORMATS = " ".join(AUDIO_EXTENSIONS)
 
     def __init__(self, root):
         self.root = root
@@ -192,7 +191,10 @@ class MusicTaggerGUI:
 
                 artist, title = [part.strip() for part in filename_no_ext.split(separator, 1)]
 
-                audio = mutagen.File(filepath, easy=True)
+                try:
+                    audio = open_audio(filepath, easy=True)
+                except Exception:
+                    audio = None
                 if audio is None:
                     try:
                         audio = EasyID3(filepath)
@@ -0,0 +1,131 @@
+# RhythmShelf Throttle
+# Version: 1.0.0
+# Author: Lewis
+#
+# This work is licensed under the MIT License.
+# See: https://opensource.org/licenses/MIT
+
+import os
+import subprocess
+import sys
+import threading
+import time
+
+
+class TokenBucket:
+    """A thread-safe token bucket. A rate of 0 (or None) means unlimited."""
+
+    def __init__(self, rate=0, burst_seconds=1.0):
+        self._lock = threading.Lock()
+        self._burst_seconds = burst_seconds
+        self._rate = 0
+        self._capacity = 0
+        self._tokens = 0
+        self._last = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        """Changes the refill rate. Safe to call while other threads are consuming."""
+        with self._lock:
+            self._refill()
+            self._rate = max(float(rate or 0), 0.0)
+            self._capacity = self._rate * self._burst_seconds
+            self._tokens = min(self._tokens, self._capacity)
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def _refill(self):
+        now = time.monotonic()
+        if self._rate:
+            self._tokens = min(self._capacity, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+    def consume(self, amount=1):
+        """Blocks until `amount` tokens are available, then takes them.
+
+        Requests larger than the bucket put it into debt instead of waiting forever,
+        so a single big chunk is still paced correctly against the ones after it.
+        """
+        while True:
+            with self._lock:
+                if not self._rate:
+                    return
+                self._refill()
+                if self._tokens >= min(amount, self._capacity):
+                    self._tokens -= amount
+                    return
+                wait = (min(amount, self._capacity) - self._tokens) / self._rate
+            # Sleep in short slices so a rate change made mid-run takes effect quickly.
+            time.sleep(min(wait, 0.25))
+
+
+class Throttle:
+    """Caps the data rate (MB/s) and file rate (files/s) of copy, move and hash operations."""
+
+    def __init__(self, mb_per_sec=0, files_per_sec=0):
+        self.bytes_bucket = TokenBucket()
+        self.files_bucket = TokenBucket()
+        self.set_limits(mb_per_sec, files_per_sec)
+
+    def set_limits(self, mb_per_sec=0, files_per_sec=0):
+        """Updates both limits; 0 disables a limit. Can be called while a run is in progress."""
+        self.bytes_bucket.set_rate((mb_per_sec or 0) * 1024 * 1024)
+        self.files_bucket.set_rate(files_per_sec or 0)
+
+    @property
+    def limits_data(self):
+        return self.bytes_bucket.rate > 0
+
+    def file(self):
+        """Accounts for one file operation."""
+        self.files_bucket.consume(1)
+
+    def data(self, nbytes):
+        """Accounts for `nbytes` of data read or written."""
+        if nbytes:
+            self.bytes_bucket.consume(nbytes)
+
+
+def parse_limit(text):
+    """Parses a limit typed into the GUI. Blank, invalid or negative values mean unlimited."""
+    try:
+        return max(float(text), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def set_idle_priority():
+    """Lowers the CPU and disk priority of the calling worker thread so background runs
+    don't compete with foreground work. Returns True if anything was changed.
+
+    Only the calling thread is affected, so the GUI stays responsive. This works on Linux,
+    where priorities are per-thread, and on Windows via background mode; elsewhere the
+    only option would lower the whole process for good, so nothing is changed. Threads
+    don't reliably inherit the setting, so each worker thread should call this itself.
+    """
+    if sys.platform == "win32":
+        import ctypes
+        THREAD_MODE_BACKGROUND_BEGIN = 0x00010000  # Lowers both CPU and I/O priority
+        kernel32 = ctypes.windll.kernel32
+        return bool(kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN))
+    if not sys.platform.startswith("linux"):
+        return False
+
+    target = threading.get_native_id()
+    changed = False
+    try:
+        os.setpriority(os.PRIO_PROCESS, target, 19)
+        changed = True
+    except OSError:
+        pass
+
+    try:
+        # Idle I/O class: only gets disk time when nobody else wants it.
+        result = subprocess.run(["ionice", "-c", "3", "-p", str(target)],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        changed = changed or result.returncode == 0
+    except OSError:
+        pass  # ionice not installed
+    return changed